@@ -1,8 +1,10 @@
 import pandas as pd
 import numpy as np
-import yfinance as yf
 import math
 
+from vpa_data import get_daily_data, get_universe_data
+from vpa_numba import ANOMALY_COLS, backtest_core, daily_returns, vpa_flags
+
 # =========================
 # CONFIG
 # =========================
@@ -18,118 +20,52 @@ LOOKBACK_WINDOW = 20
 HOLD_BARS = 5
 
 
-# =========================
-# DATA (FREE - yfinance)
-# =========================
-def get_daily_data(symbol, start):
-    df = yf.download(symbol, start=start, auto_adjust=True, progress=False)
-    if isinstance(df.columns, pd.MultiIndex):
-        df.columns = df.columns.droplevel(1)
-    df = df.dropna()
-    return df
-
-
 # =========================
 # VPA ANOMALY DETECTION
 # =========================
 def detect_vpa_anomalies(df, lookback=LOOKBACK_WINDOW):
-    data = df.copy()
-    data['Spread'] = (data['High'] - data['Low']).abs()
-    data['Body'] = data['Close'] - data['Open']
-    data['IsUp'] = data['Body'] > 0
-    data['IsDown'] = data['Body'] < 0
-
-    data['Spread_p75'] = data['Spread'].rolling(lookback).quantile(0.75)
-    data['Spread_p25'] = data['Spread'].rolling(lookback).quantile(0.25)
-    data['Vol_p_low'] = data['Volume'].rolling(lookback).quantile(0.25)
-    data['Vol_p_high'] = data['Volume'].rolling(lookback).quantile(0.75)
-
-    data['WideSpread'] = data['Spread'] > data['Spread_p75']
-    data['NarrowSpread'] = data['Spread'] < data['Spread_p25']
-    data['LowVol'] = data['Volume'] < data['Vol_p_low']
-    data['HighVol'] = data['Volume'] > data['Vol_p_high']
-
-    # Anomaly Type 1: Wide spread + Low volume (fake move)
-    data['Anomaly_FakeUp'] = data['IsUp'] & data['WideSpread'] & data['LowVol']
-    data['Anomaly_FakeDown'] = data['IsDown'] & data['WideSpread'] & data['LowVol']
-
-    # Anomaly Type 2: Narrow spread + High volume (absorption)
-    data['Anomaly_AbsorbUp'] = data['IsUp'] & data['NarrowSpread'] & data['HighVol']
-    data['Anomaly_AbsorbDown'] = data['IsDown'] & data['NarrowSpread'] & data['HighVol']
-
-    # Confirmation (legit moves)
-    data['Confirm_Up'] = data['IsUp'] & data['WideSpread'] & data['HighVol']
-    data['Confirm_Down'] = data['IsDown'] & data['WideSpread'] & data['HighVol']
+    # Wide/narrow spread vs. low/high volume, one fused pass:
+    # Type 1 fake moves, Type 2 absorption, and confirmation bars
+    flags = vpa_flags(df['Open'].to_numpy(), df['High'].to_numpy(),
+                      df['Low'].to_numpy(), df['Close'].to_numpy(),
+                      df['Volume'].to_numpy(), lookback)
+    cols = dict(zip(ANOMALY_COLS, flags))
 
     # Combined trade signals
-    data['Signal_Long'] = data['Anomaly_FakeDown'] | data['Anomaly_AbsorbDown']
-    data['Signal_Short'] = data['Anomaly_FakeUp'] | data['Anomaly_AbsorbUp']
+    cols['Signal_Long'] = cols['Anomaly_FakeDown'] | cols['Anomaly_AbsorbDown']
+    cols['Signal_Short'] = cols['Anomaly_FakeUp'] | cols['Anomaly_AbsorbUp']
 
-    return data
+    # Only the new columns, aligned to df; the OHLCV frame is not copied
+    return pd.DataFrame(cols, index=df.index)
 
 
 # =========================
 # BACKTEST
 # =========================
-def backtest_vpa(df, hold_bars=HOLD_BARS, cost=COST_PER_TRADE,
-                 initial_equity=INITIAL_EQUITY, mode='long_only'):
-    data = df.copy()
-    data['Return'] = data['Close'].pct_change().fillna(0.0)
-
-    equity = [initial_equity]
-    position = 0
-    bars_held = 0
-    entry_date = None
-    trades = []
-
-    for i in range(1, len(data)):
-        row = data.iloc[i]
-        prev_row = data.iloc[i - 1]
-        daily_ret = row['Return']
-
-        pnl = position * daily_ret if position != 0 else 0.0
-
-        if position != 0:
-            bars_held += 1
-
-        # Exit after hold period
-        if position != 0 and bars_held >= hold_bars:
-            pnl -= cost
-            trades.append({
-                'entry_date': entry_date,
-                'exit_date': row.name,
-                'direction': 'LONG' if position == 1 else 'SHORT',
-                'bars_held': bars_held,
-            })
-            position = 0
-            bars_held = 0
-
-        # Entry (only if flat, using previous bar signal)
-        if position == 0:
-            if prev_row.get('Signal_Long', False) and mode in ('long_only', 'long_short'):
-                position = 1
-                bars_held = 0
-                entry_date = row.name
-                pnl -= cost
-            elif prev_row.get('Signal_Short', False) and mode in ('short_only', 'long_short'):
-                position = -1
-                bars_held = 0
-                entry_date = row.name
-                pnl -= cost
-
-        new_eq = equity[-1] * (1.0 + pnl)
-        equity.append(new_eq)
-
-    data = data.iloc[:len(equity)]
-    data['Equity'] = equity
-    data['Strategy_Return'] = pd.Series(equity).pct_change().fillna(0.0).values[:len(data)]
+def backtest_vpa(df, sig_long, sig_short, hold_bars=HOLD_BARS,
+                 cost=COST_PER_TRADE, initial_equity=INITIAL_EQUITY,
+                 mode='long_only', returns=None):
+    # Pass `returns` (from daily_returns) to reuse it across several modes
+    if returns is None:
+        returns = daily_returns(df)
+
+    equity, strat_ret, trades = backtest_core(
+        returns, sig_long, sig_short, mode, hold_bars, cost, initial_equity,
+    )
+
+    data = pd.DataFrame({
+        'Close': df['Close'].astype(np.float64),
+        'Return': returns,
+        'Equity': equity,
+        'Strategy_Return': strat_ret,
+    }, index=df.index)
     return data, trades
 
 
 # =========================
 # METRICS
 # =========================
-def calc_metrics(data, trades, label="VPA Strategy"):
+def calc_metrics(data, trades, counts, label="VPA Strategy"):
     eq = data['Equity']
     rets = data['Strategy_Return']
 
@@ -145,10 +81,7 @@ def calc_metrics(data, trades, label="VPA Strategy"):
 
     total_trades = len(trades)
 
-    n_fake_up = data.get('Anomaly_FakeUp', pd.Series(dtype=bool)).sum()
-    n_fake_down = data.get('Anomaly_FakeDown', pd.Series(dtype=bool)).sum()
-    n_absorb_up = data.get('Anomaly_AbsorbUp', pd.Series(dtype=bool)).sum()
-    n_absorb_down = data.get('Anomaly_AbsorbDown', pd.Series(dtype=bool)).sum()
+    n_fake_up, n_fake_down, n_absorb_up, n_absorb_down = counts
 
     print(f"\n{'='*50}")
     print(f"  {label}")
@@ -176,11 +109,16 @@ def scan_for_anomalies_today(symbols):
     print(f"  VPA ANOMALY SCANNER - {pd.Timestamp.now().strftime('%Y-%m-%d %H:%M')}")
     print(f"{'='*60}")
 
+    # One batched download for the whole watchlist
+    data, failed = get_universe_data(symbols, '2025-06-01', use_cache=False)
+
     for sym in symbols:
+        if sym in failed:
+            print(f"  {sym:6s} | ERROR: no data downloaded")
+            continue
+        df = data[sym]
         try:
-            df = get_daily_data(sym, '2025-06-01')
-            df = detect_vpa_anomalies(df)
-            last = df.iloc[-1]
+            last = detect_vpa_anomalies(df).iloc[-1]
 
             signals = []
             if last['Anomaly_FakeUp']:
@@ -197,7 +135,7 @@ def scan_for_anomalies_today(symbols):
                 signals.append("CONFIRMED DOWN")
 
             status = ', '.join(signals) if signals else "-- no anomaly"
-            print(f"  {sym:6s} | ${last['Close']:.2f} | {status}")
+            print(f"  {sym:6s} | ${df['Close'].iloc[-1]:.2f} | {status}")
         except Exception as e:
             print(f"  {sym:6s} | ERROR: {e}")
 
@@ -212,18 +150,25 @@ def main():
     df = get_daily_data(SYMBOL, START_DATE)
     print(f"Data: {df.index[0].date()} to {df.index[-1].date()}, {len(df)} bars\n")
 
-    df = detect_vpa_anomalies(df)
+    # One detection pass feeds the backtests, the counts and the CSV
+    anomalies = detect_vpa_anomalies(df)
+    sig_long = anomalies['Signal_Long'].to_numpy('int8')
+    sig_short = anomalies['Signal_Short'].to_numpy('int8')
+    counts = np.count_nonzero(anomalies[ANOMALY_COLS[:4]].to_numpy(), axis=0)
+    returns = daily_returns(df)
 
     # Backtest long-only
-    data_long, trades_long = backtest_vpa(df, mode='long_only')
-    calc_metrics(data_long, trades_long, label=f"VPA Long-Only ({SYMBOL})")
+    data_long, trades_long = backtest_vpa(df, sig_long, sig_short,
+                                          mode='long_only', returns=returns)
+    calc_metrics(data_long, trades_long, counts, label=f"VPA Long-Only ({SYMBOL})")
 
     # Backtest long-short
-    data_ls, trades_ls = backtest_vpa(df, mode='long_short')
-    calc_metrics(data_ls, trades_ls, label=f"VPA Long-Short ({SYMBOL})")
+    data_ls, trades_ls = backtest_vpa(df, sig_long, sig_short,
+                                      mode='long_short', returns=returns)
+    calc_metrics(data_ls, trades_ls, counts, label=f"VPA Long-Short ({SYMBOL})")
 
     # Buy and hold comparison
-    bh_ret = df['Close'].iloc[-1] / df['Close'].iloc[0] - 1.0
+    bh_ret = data_long['Close'].iloc[-1] / data_long['Close'].iloc[0] - 1.0
     bh_cagr = (1.0 + bh_ret) ** (252.0 / len(df)) - 1.0
     print(f"  {SYMBOL} Buy & Hold: Total={bh_ret*100:.2f}%  CAGR={bh_cagr*100:.2f}%\n")
 
@@ -236,9 +181,9 @@ def main():
     scan_for_anomalies_today(watchlist)
 
     # Save equity curve to CSV
-    data_long[['Close', 'Volume', 'Equity', 'Anomaly_FakeUp',
-               'Anomaly_FakeDown', 'Anomaly_AbsorbUp',
-               'Anomaly_AbsorbDown']].to_csv('vpa_backtest.csv')
+    pd.concat([df[['Close', 'Volume']], data_long['Equity'],
+               anomalies[ANOMALY_COLS[:4]]],
+              axis=1).to_csv('vpa_backtest.csv')
     print("Saved backtest results to vpa_backtest.csv")
 
 
@@ -0,0 +1,86 @@
+import functools
+import os
+from datetime import date
+
+import pandas as pd
+import yfinance as yf
+
+# =========================
+# CONFIG
+# =========================
+CACHE_DIR = '.cache'  # same-day yfinance downloads
+
+# float32 is ample for prices and halves the bytes the detection scans;
+# volume stays exact int64, and returns/equity are computed in float64
+OHLCV_DTYPES = {
+    'Open': 'float32', 'High': 'float32', 'Low': 'float32',
+    'Close': 'float32', 'Volume': 'int64',
+}
+
+
+# =========================
+# DISK CACHE
+# =========================
+def _cache_path(symbol, start):
+    return os.path.join(CACHE_DIR, f"{symbol}_{start}.parquet")
+
+
+def _load_cached(symbol, start):
+    # Reuse a download only if it was written today
+    path = _cache_path(symbol, start)
+    if os.path.exists(path) and date.fromtimestamp(os.path.getmtime(path)) == date.today():
+        return pd.read_parquet(path)
+    return None
+
+
+def _save_cached(symbol, start, df):
+    if len(df):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        df.to_parquet(_cache_path(symbol, start))
+
+
+# =========================
+# DOWNLOADS (FREE - yfinance)
+# =========================
+@functools.lru_cache(maxsize=None)
+def get_daily_data(symbol, start, use_cache=True):
+    # use_cache=False skips the disk cache (live scanners need today's bar)
+    df = _load_cached(symbol, start) if use_cache else None
+    if df is not None:
+        return df
+    df = yf.download(symbol, start=start, auto_adjust=True, progress=False)
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.droplevel(1)
+    df = df.dropna().astype(OHLCV_DTYPES)
+    if use_cache:
+        _save_cached(symbol, start, df)
+    return df
+
+
+def get_universe_data(symbols, start, use_cache=True):
+    # Serve today's downloads from disk, fetch the rest in one batched request.
+    # Returns ({symbol: frame} in input order, [symbols with no data])
+    data = {}
+    if use_cache:
+        for sym in symbols:
+            df = _load_cached(sym, start)
+            if df is not None:
+                data[sym] = df
+    missing = [sym for sym in symbols if sym not in data]
+    if missing:
+        raw = yf.download(missing, start=start, auto_adjust=True, progress=False,
+                          group_by='ticker', threads=True)
+        if isinstance(raw.columns, pd.MultiIndex):
+            tickers = set(raw.columns.get_level_values(0))
+            frames = {sym: raw[sym] for sym in missing if sym in tickers}
+        else:
+            # Older yfinance returns flat columns for a single ticker
+            frames = {missing[0]: raw}
+        for sym, df in frames.items():
+            df = df.dropna().astype(OHLCV_DTYPES)
+            if len(df):
+                data[sym] = df
+                if use_cache:
+                    _save_cached(sym, start, df)
+    failed = [sym for sym in symbols if sym not in data]
+    return {sym: data[sym] for sym in symbols if sym in data}, failed
@@ -1,9 +1,10 @@
 import pandas as pd
-import numpy as np
-import yfinance as yf
 import math
 from datetime import datetime
 
+from vpa_data import get_universe_data
+from vpa_numba import ANOMALY_COLS, backtest_core, daily_returns, vpa_flags, vpa_kernel
+
 # =========================
 # CONFIG
 # =========================
@@ -30,77 +31,39 @@ ETF_UNIVERSE = {
 # Flatten to one list
 ALL_ETFS = [sym for group in ETF_UNIVERSE.values() for sym in group]
 
-# =========================
-# DATA
-# =========================
-def get_daily_data(symbol, start):
-    df = yf.download(symbol, start=start, auto_adjust=True, progress=False)
-    if isinstance(df.columns, pd.MultiIndex):
-        df.columns = df.columns.droplevel(1)
-    df = df.dropna()
-    return df
-
 # =========================
 # VPA ANOMALY DETECTION
 # =========================
 def detect_vpa_anomalies(df, lookback=LOOKBACK_WINDOW):
-    d = df.copy()
-    d['Spread']       = (d['High'] - d['Low']).abs()
-    d['Body']         = d['Close'] - d['Open']
-    d['IsUp']         = d['Body'] > 0
-    d['IsDown']       = d['Body'] < 0
-    d['Spread_p75']   = d['Spread'].rolling(lookback).quantile(0.75)
-    d['Spread_p25']   = d['Spread'].rolling(lookback).quantile(0.25)
-    d['Vol_p_low']    = d['Volume'].rolling(lookback).quantile(0.25)
-    d['Vol_p_high']   = d['Volume'].rolling(lookback).quantile(0.75)
-    d['WideSpread']   = d['Spread'] > d['Spread_p75']
-    d['NarrowSpread'] = d['Spread'] < d['Spread_p25']
-    d['LowVol']       = d['Volume'] < d['Vol_p_low']
-    d['HighVol']      = d['Volume'] > d['Vol_p_high']
-    # Anomalies
-    d['Anomaly_FakeUp']     = d['IsUp']   & d['WideSpread']   & d['LowVol']
-    d['Anomaly_FakeDown']   = d['IsDown'] & d['WideSpread']   & d['LowVol']
-    d['Anomaly_AbsorbUp']   = d['IsUp']   & d['NarrowSpread'] & d['HighVol']
-    d['Anomaly_AbsorbDown'] = d['IsDown'] & d['NarrowSpread'] & d['HighVol']
-    d['Confirm_Up']         = d['IsUp']   & d['WideSpread']   & d['HighVol']
-    d['Confirm_Down']       = d['IsDown'] & d['WideSpread']   & d['HighVol']
-    d['Signal_Long']  = d['Anomaly_FakeDown'] | d['Anomaly_AbsorbDown']
-    d['Signal_Short'] = d['Anomaly_FakeUp']   | d['Anomaly_AbsorbUp']
-    return d
+    # Returns only the anomaly/signal columns, aligned to df.index
+    flags = vpa_flags(df['Open'].to_numpy(), df['High'].to_numpy(), df['Low'].to_numpy(),
+                      df['Close'].to_numpy(), df['Volume'].to_numpy(), lookback)
+    cols = dict(zip(ANOMALY_COLS, flags))
+    cols['Signal_Long']  = cols['Anomaly_FakeDown'] | cols['Anomaly_AbsorbDown']
+    cols['Signal_Short'] = cols['Anomaly_FakeUp']   | cols['Anomaly_AbsorbUp']
+    return pd.DataFrame(cols, index=df.index)
+
+def vpa_signals(df, lookback=LOOKBACK_WINDOW):
+    # (sig_long, sig_short, anomaly counts) without building the flag columns
+    return vpa_kernel(df['Open'].to_numpy(), df['High'].to_numpy(), df['Low'].to_numpy(),
+                      df['Close'].to_numpy(), df['Volume'].to_numpy(), lookback)
 
 # =========================
 # BACKTEST
 # =========================
-def backtest_vpa(df, hold_bars=HOLD_BARS, cost=COST_PER_TRADE,
-                 initial_equity=INITIAL_EQUITY, mode='long_only'):
-    data = df.copy()
-    data['Return'] = data['Close'].pct_change().fillna(0.0)
-    equity = [initial_equity]
-    position, bars_held, entry_date = 0, 0, None
-    trades = []
-    for i in range(1, len(data)):
-        row      = data.iloc[i]
-        prev_row = data.iloc[i - 1]
-        pnl = position * row['Return'] if position != 0 else 0.0
-        if position != 0:
-            bars_held += 1
-        if position != 0 and bars_held >= hold_bars:
-            pnl -= cost
-            trades.append({'entry_date': entry_date, 'exit_date': row.name,
-                           'direction': 'LONG' if position == 1 else 'SHORT',
-                           'bars_held': bars_held})
-            position, bars_held = 0, 0
-        if position == 0:
-            if prev_row.get('Signal_Long', False) and mode in ('long_only','long_short'):
-                position, bars_held, entry_date = 1, 0, row.name
-                pnl -= cost
-            elif prev_row.get('Signal_Short', False) and mode in ('short_only','long_short'):
-                position, bars_held, entry_date = -1, 0, row.name
-                pnl -= cost
-        equity.append(equity[-1] * (1.0 + pnl))
-    data = data.iloc[:len(equity)]
-    data['Equity'] = equity
-    data['Strategy_Return'] = pd.Series(equity).pct_change().fillna(0.0).values[:len(data)]
+def backtest_vpa(df, sig_long, sig_short, hold_bars=HOLD_BARS, cost=COST_PER_TRADE,
+                 initial_equity=INITIAL_EQUITY, mode='long_only', returns=None):
+    # Pass `returns` (from daily_returns) to reuse it across several modes
+    if returns is None:
+        returns = daily_returns(df)
+    equity, strat_ret, trades = backtest_core(returns, sig_long, sig_short, mode, hold_bars,
+                                              cost, initial_equity)
+    data = pd.DataFrame({
+        'Close':           df['Close'].astype('float64'),
+        'Return':          returns,
+        'Equity':          equity,
+        'Strategy_Return': strat_ret,
+    }, index=df.index)
     return data, trades
 
 # =========================
@@ -138,13 +101,14 @@ def scan_today(symbols):
     print(f"{'='*70}")
     alerts = []
     clean  = []
-    for sym in symbols:
+    data, failed = get_universe_data(symbols, '2025-06-01', use_cache=False)
+    for sym in failed:
+        print(f"  {sym}: ERROR - no data downloaded")
+    for sym, df in data.items():
         try:
-            df = get_daily_data(sym, '2025-06-01')
             if len(df) < LOOKBACK_WINDOW + 2:
                 continue
-            df = detect_vpa_anomalies(df)
-            last = df.iloc[-1]
+            last = detect_vpa_anomalies(df).iloc[-1]
             sigs = []
             if last['Anomaly_FakeUp']:     sigs.append('FAKE UP   (bearish reversal)')
             if last['Anomaly_FakeDown']:   sigs.append('FAKE DOWN (bullish reversal)')
@@ -152,8 +116,8 @@ def scan_today(symbols):
             if last['Anomaly_AbsorbDown']: sigs.append('ABSORB DOWN (bullish absorption)')
             if last['Confirm_Up']:         sigs.append('CONFIRM UP   (trend continuation)')
             if last['Confirm_Down']:       sigs.append('CONFIRM DOWN (trend continuation)')
-            price = last['Close']
-            vol   = int(last['Volume'])
+            price = df['Close'].iloc[-1]
+            vol   = int(df['Volume'].iloc[-1])
             if sigs:
                 for s in sigs:
                     alerts.append({'Symbol': sym, 'Price': price, 'Volume': vol, 'Signal': s})
@@ -179,16 +143,18 @@ def scan_today(symbols):
 def backtest_all(symbols):
     results = []
     print(f"\nRunning daily backtest on {len(symbols)} ETFs from {START_DATE}...")
-    for sym in symbols:
+    data, failed = get_universe_data(symbols, START_DATE)
+    for sym in failed:
+        print(f"  {sym}: ERROR - no data downloaded")
+    for sym, df in data.items():
         try:
-            df = get_daily_data(sym, START_DATE)
             if len(df) < LOOKBACK_WINDOW + 10:
                 continue
-            df = detect_vpa_anomalies(df)
+            sig_long, sig_short, _ = vpa_signals(df)
+            returns = daily_returns(df)
             for mode in ('long_only', 'long_short'):
-                data, trades = backtest_vpa(df, mode=mode)
-                r = calc_metrics(data, trades, sym, mode)
-                results.append(r)
+                bt, trades = backtest_vpa(df, sig_long, sig_short, mode=mode, returns=returns)
+                results.append(calc_metrics(bt, trades, sym, mode))
         except Exception as e:
             print(f"  {sym}: ERROR - {e}")
     return pd.DataFrame(results)
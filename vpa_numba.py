@@ -0,0 +1,243 @@
+import numpy as np
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    # Kernels below then run as plain Python; the window-scan ones are
+    # swapped for vectorized numpy versions further down
+    HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        return lambda f: f
+
+# =========================
+# QUARTILE RANK FLAGS
+# =========================
+# The detection only asks "is this bar above p75 / below p25 of its window",
+# which is a rank question. With pandas' linear interpolation:
+#   x > p75  <=>  more than floor(0.75*(w-1)) window values are below x
+#   x < p25  <=>  at least w - ceil(0.25*(w-1)) window values are above x
+# so the quantile values themselves never need to be computed.
+@njit(cache=True)
+def _quartile_ranks(w):
+    return int(np.floor(0.75 * (w - 1))), w - int(np.ceil(0.25 * (w - 1)))
+
+
+@njit(cache=True)
+def _in_quartiles(x, i, w, k_top, k_bottom):
+    below, above = 0, 0
+    for j in range(i - w + 1, i + 1):
+        if x[j] < x[i]:
+            below += 1
+        elif x[j] > x[i]:
+            above += 1
+    return below > k_top, above >= k_bottom
+
+
+# =========================
+# FUSED VPA FLAGS
+# =========================
+# Column order of the vpa_flags() outputs
+ANOMALY_COLS = ['Anomaly_FakeUp', 'Anomaly_FakeDown', 'Anomaly_AbsorbUp',
+                'Anomaly_AbsorbDown', 'Confirm_Up', 'Confirm_Down']
+
+
+@njit(cache=True)
+def vpa_flags(open_, high, low, close, volume, w):
+    # One pass over the bars -> FakeUp, FakeDown, AbsorbUp, AbsorbDown,
+    # ConfirmUp, ConfirmDown as bool arrays (warmup bars stay False)
+    n = close.shape[0]
+    fake_up      = np.zeros(n, np.bool_)
+    fake_down    = np.zeros(n, np.bool_)
+    absorb_up    = np.zeros(n, np.bool_)
+    absorb_down  = np.zeros(n, np.bool_)
+    confirm_up   = np.zeros(n, np.bool_)
+    confirm_down = np.zeros(n, np.bool_)
+    spread = np.empty(n)
+    for i in range(n):
+        spread[i] = abs(high[i] - low[i])
+    k_top, k_bottom = _quartile_ranks(w)
+    for i in range(w - 1, n):
+        wide, narrow  = _in_quartiles(spread, i, w, k_top, k_bottom)
+        high_v, low_v = _in_quartiles(volume, i, w, k_top, k_bottom)
+        body    = close[i] - open_[i]
+        is_up   = body > 0
+        is_down = body < 0
+        fake_up[i]      = is_up   and wide   and low_v
+        fake_down[i]    = is_down and wide   and low_v
+        absorb_up[i]    = is_up   and narrow and high_v
+        absorb_down[i]  = is_down and narrow and high_v
+        confirm_up[i]   = is_up   and wide   and high_v
+        confirm_down[i] = is_down and wide   and high_v
+    return fake_up, fake_down, absorb_up, absorb_down, confirm_up, confirm_down
+
+
+@njit(cache=True)
+def vpa_kernel(open_, high, low, close, volume, w):
+    # Same detection as vpa_flags, reduced on the fly to what the backtest
+    # needs: int8 long/short signals plus counts of FakeUp, FakeDown,
+    # AbsorbUp, AbsorbDown
+    n = close.shape[0]
+    sig_long  = np.zeros(n, np.int8)
+    sig_short = np.zeros(n, np.int8)
+    counts    = np.zeros(4, np.int64)
+    spread = np.empty(n)
+    for i in range(n):
+        spread[i] = abs(high[i] - low[i])
+    k_top, k_bottom = _quartile_ranks(w)
+    for i in range(w - 1, n):
+        body = close[i] - open_[i]
+        if body == 0:
+            continue
+        wide, narrow  = _in_quartiles(spread, i, w, k_top, k_bottom)
+        high_v, low_v = _in_quartiles(volume, i, w, k_top, k_bottom)
+        fake   = wide and low_v
+        absorb = narrow and high_v
+        if body > 0:
+            counts[0] += fake
+            counts[2] += absorb
+            sig_short[i] = fake or absorb
+        else:
+            counts[1] += fake
+            counts[3] += absorb
+            sig_long[i] = fake or absorb
+    return sig_long, sig_short, counts
+
+
+# =========================
+# NUMPY FALLBACK (no numba)
+# =========================
+if not HAVE_NUMBA:
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    def _rank_flags(x, w):
+        # Same rank test as _in_quartiles, for every window at once
+        n = x.shape[0]
+        top    = np.zeros(n, np.bool_)
+        bottom = np.zeros(n, np.bool_)
+        if n >= w:
+            win = sliding_window_view(x, w)
+            cur = x[w - 1:, None]
+            k_top, k_bottom = _quartile_ranks(w)
+            top[w - 1:]    = (win < cur).sum(axis=1) > k_top
+            bottom[w - 1:] = (win > cur).sum(axis=1) >= k_bottom
+        return top, bottom
+
+    def _np_anomalies(open_, high, low, close, volume, w):
+        wide, narrow  = _rank_flags(np.abs(high - low), w)
+        high_v, low_v = _rank_flags(volume, w)
+        body    = close - open_
+        is_up   = body > 0
+        is_down = body < 0
+        return is_up, is_down, wide, narrow, high_v, low_v
+
+    def vpa_flags(open_, high, low, close, volume, w):
+        is_up, is_down, wide, narrow, high_v, low_v = \
+            _np_anomalies(open_, high, low, close, volume, w)
+        return (is_up & wide & low_v, is_down & wide & low_v,
+                is_up & narrow & high_v, is_down & narrow & high_v,
+                is_up & wide & high_v, is_down & wide & high_v)
+
+    def vpa_kernel(open_, high, low, close, volume, w):
+        is_up, is_down, wide, narrow, high_v, low_v = \
+            _np_anomalies(open_, high, low, close, volume, w)
+        fake, absorb = wide & low_v, narrow & high_v
+        counts = np.array([np.count_nonzero(is_up & fake), np.count_nonzero(is_down & fake),
+                           np.count_nonzero(is_up & absorb), np.count_nonzero(is_down & absorb)],
+                          dtype=np.int64)
+        return ((is_down & (fake | absorb)).astype(np.int8),
+                (is_up & (fake | absorb)).astype(np.int8), counts)
+
+
+# =========================
+# BACKTEST LOOP
+# =========================
+TRADE_DTYPE = np.dtype([('entry', np.int32), ('exit', np.int32),
+                        ('dir', np.int8), ('bars', np.int16)])
+
+
+@njit(cache=True)
+def run_bt(sig_long, sig_short, ret, hold, cost, allow_long, allow_short,
+           initial_equity, trades):
+    # Flat -> long/short for exactly `hold` bars, entering on the previous
+    # bar's signal. Fills `trades` and returns (equity, n_trades).
+    # Nothing can happen before the bar after the first signal, so equity
+    # is flat up to there and the loop starts at that bar.
+    n = ret.shape[0]
+    start = n
+    for i in range(n - 1):
+        if sig_long[i] or sig_short[i]:
+            start = i + 1
+            break
+    equity = np.empty(n)
+    equity[:start] = initial_equity
+    eq = float(initial_equity)  # running value stays in a register
+    position, bars_held, entry_i, k = 0, 0, 0, 0
+    for i in range(start, n):
+        pnl = position * ret[i] if position != 0 else 0.0
+        if position != 0:
+            bars_held += 1
+        # Exit after hold period
+        if position != 0 and bars_held >= hold:
+            pnl -= cost
+            trades[k]['entry'] = entry_i
+            trades[k]['exit'] = i
+            trades[k]['dir'] = position
+            trades[k]['bars'] = bars_held
+            k += 1
+            position, bars_held = 0, 0
+        # Entry (only if flat, using previous bar signal)
+        if position == 0:
+            if sig_long[i - 1] and allow_long:
+                position, bars_held, entry_i = 1, 0, i
+                pnl -= cost
+            elif sig_short[i - 1] and allow_short:
+                position, bars_held, entry_i = -1, 0, i
+                pnl -= cost
+        eq *= 1.0 + pnl
+        equity[i] = eq
+    return equity, k
+
+
+def daily_returns(df):
+    return df['Close'].astype(np.float64).pct_change().fillna(0.0).to_numpy()
+
+
+def backtest_core(returns, sig_long, sig_short, mode, hold_bars, cost,
+                  initial_equity):
+    # Arrays in, arrays out: (equity, strategy returns, trade records).
+    # At most one trade per hold period; records are (entry, exit, dir, bars)
+    # bar positions -> df.index[trades['entry']] for dates
+    trades_buf = np.empty(len(returns) // max(hold_bars, 1) + 1, dtype=TRADE_DTYPE)
+    equity, k = run_bt(sig_long, sig_short, returns, hold_bars, cost,
+                       mode in ('long_only', 'long_short'),
+                       mode in ('short_only', 'long_short'),
+                       initial_equity, trades_buf)
+    strat_ret = np.empty_like(equity)
+    strat_ret[0] = 0.0
+    strat_ret[1:] = equity[1:] / equity[:-1] - 1.0
+    return equity, strat_ret, trades_buf[:k]
+
+
+# =========================
+# WARMUP
+# =========================
+def warmup():
+    # Run every kernel once with the argument types the scripts use
+    # (float32 prices, int64 volume, int8 signals, float64 returns). The
+    # first run ever compiles and writes the on-disk cache; later processes
+    # just load it. Numba specializes on writeability, and columns pulled
+    # from a pandas Copy-on-Write frame are read-only while older pandas
+    # hands out writable arrays, so both layouts are warmed.
+    sig = np.zeros(32, np.int8)
+    for writeable in (True, False):
+        px, vol, ret = np.zeros(32, np.float32), np.zeros(32, np.int64), np.zeros(32)
+        for a in (px, vol, ret):
+            a.setflags(write=writeable)
+        vpa_flags(px, px, px, px, vol, 20)
+        vpa_kernel(px, px, px, px, vol, 20)
+        run_bt(sig, sig, ret, 5, 0.001, True, True, 1.0,
+               np.empty(32, dtype=TRADE_DTYPE))
+
+warmup()